@@ -30,6 +30,7 @@ from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 
 from jsonschema import Draft202012Validator
+from openai import RateLimitError
 from pypdf import PdfReader
 from pydantic import BaseModel
 from app.services.openai_client import client as openai_client
@@ -438,9 +439,10 @@ def _ensure_features_minimal(prog: Dict[str, Any]) -> Dict[str, Any]:
     prog["features"] = feats
     return prog
 
-def _augment_with_detected_variants(pruned_payload: Dict[str, Any], pdf_bytes: bytes) -> Dict[str, Any]:
+def _augment_with_detected_variants(pruned_payload: Dict[str, Any], pdf_bytes: bytes, full_text: Optional[str] = None) -> Dict[str, Any]:
     programs = pruned_payload.get("programs") or []
-    full_text, _ = _pdf_pages_text(pdf_bytes)
+    if full_text is None:
+        full_text, _ = _pdf_pages_text(pdf_bytes)
     detected = _detect_base_programs_from_text(full_text)
 
     ws = list(pruned_payload.get("warnings") or [])
@@ -714,12 +716,13 @@ def _apply_global_overrides(features: Dict[str, Any], full_text: str) -> Dict[st
 
     return features
 
-def _merge_papild_into_programs(payload: Dict[str, Any], pdf_bytes: bytes) -> Dict[str, Any]:
+def _merge_papild_into_programs(payload: Dict[str, Any], pdf_bytes: bytes, full_text: Optional[str] = None) -> Dict[str, Any]:
     """
     Detect Papildprogrammas and merge their feature values into each base program.
     We do not alter program counts; we only enrich features.
     """
-    full_text, _ = _pdf_pages_text(pdf_bytes)
+    if full_text is None:
+        full_text, _ = _pdf_pages_text(pdf_bytes)
     pp = extract_papildprogrammas_features(full_text)
 
     progs = payload.get("programs") or []
@@ -832,6 +835,12 @@ def _chat_with_text(model: str, document_id: str, pdf_bytes: bytes) -> Dict[str,
 class ExtractionError(Exception):
     pass
 
+def _retry_delay(err: Optional[Exception], attempt: int) -> float:
+    """Back off exponentially on 429s so parallel workers stop hammering the quota; short linear delay otherwise."""
+    if isinstance(err, RateLimitError):
+        return min(30.0, 2.0 ** (attempt + 1))
+    return 0.7 * (attempt + 1)
+
 def _normalize_safely(augmented: Dict[str, Any], document_id: str) -> Dict[str, Any]:
     """Run normalizer; if it collapses synthesized multi-variant programs, restore them (unless KEEP_SYNTH_MULTI=0)."""
     try:
@@ -867,7 +876,7 @@ def call_gpt_extractor(document_id: str, pdf_bytes: bytes, cfg: Optional[GPTConf
         except Exception as e:
             last_err = e
             if attempt < cfg.max_retries:
-                time.sleep(0.7 * (attempt + 1))
+                time.sleep(_retry_delay(last_err, attempt))
                 continue
 
     # 2) Responses without schema
@@ -880,7 +889,7 @@ def call_gpt_extractor(document_id: str, pdf_bytes: bytes, cfg: Optional[GPTConf
         except Exception as e:
             last_err = e
             if attempt < cfg.max_retries:
-                time.sleep(0.7 * (attempt + 1))
+                time.sleep(_retry_delay(last_err, attempt))
                 continue
             break
 
@@ -901,24 +910,30 @@ def call_gpt_extractor(document_id: str, pdf_bytes: bytes, cfg: Optional[GPTConf
         except Exception as e:
             last_err = e
             if attempt < cfg.max_retries:
-                time.sleep(0.7 * (attempt + 1))
+                time.sleep(_retry_delay(last_err, attempt))
                 continue
             break
 
     raise ExtractionError(f"GPT extraction failed: {last_err}")
 
+MAX_PDF_BYTES = 12 * 1024 * 1024
+
+
 def extract_offer_from_pdf_bytes(pdf_bytes: bytes, document_id: str) -> Dict[str, Any]:
-    if not pdf_bytes or len(pdf_bytes) > 12 * 1024 * 1024:
+    if not pdf_bytes or len(pdf_bytes) > MAX_PDF_BYTES:
         raise ExtractionError("PDF too large or empty (limit: 12MB)")
 
     # Raw extraction
     raw = call_gpt_extractor(document_id=document_id, pdf_bytes=pdf_bytes)
 
+    # Both post-processing passes read the same text; parse the PDF once (CPU-bound pypdf work)
+    full_text, _ = _pdf_pages_text(pdf_bytes)
+
     # Synthesize base variants from PAMATPROGRAMMA if applicable
-    augmented = _augment_with_detected_variants(raw, pdf_bytes)
+    augmented = _augment_with_detected_variants(raw, pdf_bytes, full_text=full_text)
 
     # Merge Papildprogrammas feature signals (incl. Maksas Operācijas + Optika 50%)
-    enriched = _merge_papild_into_programs(augmented, pdf_bytes)
+    enriched = _merge_papild_into_programs(augmented, pdf_bytes, full_text=full_text)
 
     # Normalize with safety-belt
     normalized = _normalize_safely(enriched, document_id=document_id)
@@ -1,37 +1,63 @@
 # app/main.py
 from __future__ import annotations
 
+import asyncio
+import atexit
+import base64
+import hashlib
+import logging
+import logging.handlers
 import os
+import queue
+import sys
 import re
 import time
 import uuid
-import secrets
+import shutil
+import tempfile
 import threading
-import unicodedata
 import json
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import chain, repeat
 from typing import List, Optional, Dict, Any, Tuple
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Body, Header, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.formparsers import MultiPartParser
 from pydantic import BaseModel, Field
 
 try:
     from supabase import create_client, Client  # type: ignore
+    from postgrest.types import ReturnMethod  # type: ignore
+    from postgrest.utils import SyncClient as PostgrestSyncClient  # type: ignore
 except Exception:  # pragma: no cover
     create_client = None  # type: ignore
     Client = None  # type: ignore
+    ReturnMethod = None  # type: ignore
+    PostgrestSyncClient = None  # type: ignore
 
+import httpx
+import orjson
 import psycopg2.extras
 from psycopg2.extras import RealDictCursor
 import requests
 
-from app.gpt_extractor import extract_offer_from_pdf_bytes, ExtractionError
+from app.gpt_extractor import extract_offer_from_pdf_bytes, ExtractionError, MAX_PDF_BYTES
 from app.routes.offers_by_documents import router as offers_by_documents_router
+from app.services.offers_read_cache import (
+    BoundedDict as _BoundedDict,
+    OFFERS_READ_CACHE_TTL_S,
+    generation as _offers_generation,
+    invalidate as _invalidate_offer_reads,
+    read_cache as _read_cache,
+)
 from app.routes.debug_db import router as debug_db_router
 from app.routes.ingest import router as ingest_router
 from backend.api.routes.offers_upload import router as offers_upload_router
@@ -45,10 +71,36 @@ from app.routes.translate import router as translate_router  # translation endpo
 from app.routes.casco_routes import router as casco_router  # CASCO insurance routes
 from app.extensions.pas_sidecar import run_batch_ingest_sidecar, infer_batch_token_for_docs
 from backend.api.routes.util import safe_filename as _safe_filename  # Unified filename sanitization
+from backend.api.routes.util import is_pdf_filename as _is_pdf_filename
 
 APP_NAME = "GPT Offer Extractor"
 APP_VERSION = "1.0.0"
 
+# -------------------------------
+# Logging
+# -------------------------------
+# Request handlers only enqueue records; a listener thread does the stdout write, so a
+# burst of failing Supabase calls doesn't serialize concurrent requests on the stream lock.
+logger = logging.getLogger(__name__)
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _configure_logging() -> None:
+    """
+    Startup hook: attach the queued stdout handler unless the host (uvicorn --log-config,
+    gunicorn, pytest) already configured logging. Records keep propagating either way.
+    """
+    global _log_listener
+    if _log_listener is not None or logger.handlers or logging.getLogger().handlers:
+        return
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("[warn] %(message)s"))
+    _log_listener = logging.handlers.QueueListener(log_queue, stream)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
 # -------------------------------
 # Helpers: request context & DB
 # -------------------------------
@@ -65,13 +117,15 @@ def _coalesce_int(*vals) -> Optional[int]:
     return None
 
 
+_DEFAULT_ORG_ID = int(os.getenv("DEFAULT_ORG_ID", "0") or 0)
+_DEFAULT_USER_ID = int(os.getenv("DEFAULT_USER_ID", "0") or 0)
+
+
 def _ctx_or_defaults(org_id: Optional[int], user_id: Optional[int]) -> tuple[Optional[int], Optional[int]]:
-    try_env_org = int(os.getenv("DEFAULT_ORG_ID", "0") or 0)
-    try_env_user = int(os.getenv("DEFAULT_USER_ID", "0") or 0)
-    if org_id is None and try_env_org > 0:
-        org_id = try_env_org
-    if user_id is None and try_env_user > 0:
-        user_id = try_env_user
+    if org_id is None and _DEFAULT_ORG_ID > 0:
+        org_id = _DEFAULT_ORG_ID
+    if user_id is None and _DEFAULT_USER_ID > 0:
+        user_id = _DEFAULT_USER_ID
     return org_id, user_id
 
 
@@ -127,9 +181,18 @@ def create_offer_batch(org_id: int, user_id: int, title: str = None) -> tuple[st
 # -------------------------------
 EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
 EXEC: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS)
+# /extract/pdf and /extract/multiple extract on their own pool, so a large async batch
+# queued on EXEC does not hold up requests whose client is waiting for the answer.
+REQUEST_EXTRACT_WORKERS = int(os.getenv("REQUEST_EXTRACT_WORKERS", str(EXTRACT_WORKERS)))
+REQUEST_EXEC: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=REQUEST_EXTRACT_WORKERS)
+# Vector-store ingestion after async jobs gets its own small pool: as a plain background
+# task each run would occupy a slot of the threadpool that serves sync endpoints.
+SIDECAR_WORKERS = int(os.getenv("SIDECAR_WORKERS", "2"))
+SIDECAR_EXEC: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=SIDECAR_WORKERS)
 _JOBS_LOCK = threading.Lock()
 
-app = FastAPI(title=APP_NAME, version=APP_VERSION)
+app = FastAPI(title=APP_NAME, version=APP_VERSION, default_response_class=ORJSONResponse)
+app.add_event_handler("startup", _configure_logging)
 app.include_router(offers_by_documents_router)
 app.include_router(debug_db_router)
 app.include_router(ingest_router)
@@ -143,14 +206,23 @@ app.include_router(admin_tc_router)
 app.include_router(admin_chat_router)
 app.include_router(casco_router)  # CASCO insurance routes
 
+# -------------------------------
+# Compression
+# -------------------------------
+# Offer payloads repeat the same feature keys per program/document and compress well;
+# small bodies are left alone. Registered before CORS so CORS stays the outer layer.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=int(os.getenv("GZIP_LEVEL", "5")))
+
 # -------------------------------
 # CORS
 # -------------------------------
-# Use wildcard for backward compatibility with all frontends/share links
+# Use wildcard for backward compatibility with all frontends/share links; deployments
+# that know their frontends can list them in CORS_ALLOW_ORIGINS (comma-separated).
 # Exception handlers below ensure CORS headers are present on error responses
+CORS_ALLOW_ORIGINS = [o.strip() for o in os.getenv("CORS_ALLOW_ORIGINS", "*").split(",") if o.strip()] or ["*"]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Keep wildcard for backward compatibility
+    allow_origins=CORS_ALLOW_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*", "X-Org-Id", "X-User-Id", "X-Share-Token", "X-Count-View"],
@@ -166,6 +238,56 @@ _SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 _SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 _OFFERS_TABLE = os.getenv("SUPABASE_TABLE", "offers")
 _SHARE_TABLE = os.getenv("SUPABASE_SHARE_TABLE", "share_links")
+_SHARE_BASE_URL = os.getenv("SHARE_BASE_URL")
+_GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4o-mini")
+# Per-document aggregate of the offers table (backend/scripts/create_offers_grouped_view.sql)
+_OFFERS_GROUPED_VIEW = os.getenv("SUPABASE_OFFERS_GROUPED_VIEW", "offers_grouped")
+
+# Bounded keep-alive pool for PostgREST calls (idle sockets are recycled after the expiry)
+SUPABASE_HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "10"))
+SUPABASE_HTTP_KEEPALIVE_S = float(os.getenv("SUPABASE_HTTP_KEEPALIVE_S", "30"))
+
+
+if PostgrestSyncClient is not None:
+
+    class _OrjsonPostgrestSession(PostgrestSyncClient):  # type: ignore[misc, valid-type]
+        """PostgREST session that encodes request bodies with orjson instead of stdlib json
+        (offers inserts carry whole extraction payloads in raw_json)."""
+
+        def build_request(self, method, url, *, content=None, json=None, **kwargs):
+            if json is None or content is not None:
+                return super().build_request(method, url, content=content, json=json, **kwargs)
+            body = orjson.dumps(json, option=orjson.OPT_NON_STR_KEYS)
+            request = super().build_request(method, url, content=body, **kwargs)
+            request.headers.setdefault("Content-Type", "application/json")
+            return request
+
+
+# Cached per key: without an anon key the main and admin clients share one
+# client (and one connection pool) instead of opening two to the same project.
+@lru_cache(maxsize=None)
+def _create_supabase_client(key: str) -> Client:
+    client = create_client(_SUPABASE_URL, key)
+    # supabase-py 2.7 has no option for the httpx client, so replace the PostgREST
+    # session with one that carries explicit pool limits (same headers/timeout/HTTP2)
+    # and orjson body encoding.
+    pg = client.postgrest
+    old = pg.session
+    pg.session = _OrjsonPostgrestSession(
+        base_url=old.base_url,
+        headers=old.headers,
+        timeout=old.timeout,
+        follow_redirects=True,
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=SUPABASE_HTTP_KEEPALIVE_S,
+        ),
+    )
+    old.close()
+    return client
+
 
 # Use service role key for admin operations, anon key for regular operations
 _supabase: Optional[Client] = None
@@ -173,28 +295,43 @@ _supabase_admin: Optional[Client] = None  # Admin client for auth operations
 
 if _SUPABASE_URL and _SUPABASE_SERVICE_ROLE_KEY and create_client is not None:
     try:
-        _supabase_admin = create_client(_SUPABASE_URL, _SUPABASE_SERVICE_ROLE_KEY)
+        _supabase_admin = _create_supabase_client(_SUPABASE_SERVICE_ROLE_KEY)
         # Use service role for main client if anon key not available
-        _supabase = create_client(_SUPABASE_URL, _SUPABASE_ANON_KEY or _SUPABASE_SERVICE_ROLE_KEY)
+        _supabase = _create_supabase_client(_SUPABASE_ANON_KEY or _SUPABASE_SERVICE_ROLE_KEY)
     except Exception:
         _supabase = None
         _supabase_admin = None
 
+# Table request builders are stateless (each .select()/.insert() returns a new query
+# builder), so one per table is reused instead of rebuilding it on every call.
+_offers_tbl = _supabase.table(_OFFERS_TABLE) if _supabase else None
+_shares_tbl = _supabase.table(_SHARE_TABLE) if _supabase else None
+
 
 # -------------------------------
 # Global Exception Handlers (ensure CORS headers on errors)
 # -------------------------------
 # These handlers ensure CORS headers are present even when exceptions occur
 # before CORS middleware can process the response
+def _cors_error_headers(request: Request) -> Dict[str, str]:
+    # Get origin from request header, fallback to wildcard for compatibility
+    origin = request.headers.get("origin", "*")
+    if "*" not in CORS_ALLOW_ORIGINS and origin not in CORS_ALLOW_ORIGINS:
+        return {}
+    return {
+        "Access-Control-Allow-Origin": origin if origin != "*" else "*",
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Allow-Methods": "POST, GET, OPTIONS, PUT, DELETE, PATCH",
+        "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-Org-Id, Authorization",
+    }
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Ensure CORS headers are present on all error responses."""
     import traceback
     traceback.print_exc()  # Log the error
     
-    # Get origin from request header, fallback to wildcard for compatibility
-    origin = request.headers.get("origin", "*")
-    
     # Determine status code
     if isinstance(exc, HTTPException):
         status_code = exc.status_code
@@ -209,27 +346,16 @@ async def global_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
         status_code=status_code,
         content={"detail": detail},
-        headers={
-            "Access-Control-Allow-Origin": origin if origin != "*" else "*",
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "POST, GET, OPTIONS, PUT, DELETE, PATCH",
-            "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-Org-Id, Authorization",
-        }
+        headers=_cors_error_headers(request),
     )
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """Handle validation errors with CORS headers."""
-    origin = request.headers.get("origin", "*")
     return JSONResponse(
         status_code=422,
         content={"detail": exc.errors()},
-        headers={
-            "Access-Control-Allow-Origin": origin if origin != "*" else "*",
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "POST, GET, OPTIONS, PUT, DELETE, PATCH",
-            "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-Org-Id, Authorization",
-        }
+        headers=_cors_error_headers(request),
     )
 
 
@@ -267,10 +393,28 @@ def invite_user_by_email(email: str, redirect_url: Optional[str] = None) -> dict
 # -------------------------------
 # In-memory
 # -------------------------------
-_jobs: Dict[str, Dict[str, Any]] = {}
-_LAST_RESULTS: Dict[str, Dict[str, Any]] = {}
-_SHARES_FALLBACK: Dict[str, Dict[str, Any]] = {}
-_INSERTED_IDS: Dict[str, List[int]] = {}
+LAST_RESULTS_MAX = int(os.getenv("LAST_RESULTS_MAX", "512"))
+JOBS_MAX = int(os.getenv("JOBS_MAX", "10000"))
+JOBS_TTL_S = float(os.getenv("JOBS_TTL_S", str(24 * 3600)))
+JOB_REBUILD_TTL_S = float(os.getenv("JOB_REBUILD_TTL_S", "30"))
+SHARES_FALLBACK_MAX = int(os.getenv("SHARES_FALLBACK_MAX", "1000"))
+
+
+_jobs: Dict[str, Dict[str, Any]] = _BoundedDict(JOBS_MAX, ttl_s=JOBS_TTL_S)
+_LAST_RESULTS: Dict[str, Dict[str, Any]] = _BoundedDict(LAST_RESULTS_MAX)
+_SHARES_FALLBACK: Dict[str, Dict[str, Any]] = _BoundedDict(SHARES_FALLBACK_MAX)
+# Jobs rebuilt from offers rows (False: no rows). Kept briefly, not in _jobs: the job may
+# still be running in another process, so polls re-read its rows every few seconds.
+_REBUILT_JOBS: Dict[str, Any] = _BoundedDict(JOBS_MAX, ttl_s=JOB_REBUILD_TTL_S)
+_JOB_ROWS_PAGE = 1000
+_INSERTED_IDS: Dict[str, List[int]] = _BoundedDict(LAST_RESULTS_MAX)
+# inquiry_id -> document ids (insertion-ordered) of the payloads kept in _LAST_RESULTS
+_INQUIRY_DOCS: Dict[int, Dict[str, None]] = _BoundedDict(LAST_RESULTS_MAX)
+_INQUIRY_DOCS_LOCK = threading.Lock()
+# document id -> (payload, offers rows): expansion of an in-memory payload for fallback reads
+_PAYLOAD_ROWS: Dict[str, Tuple[Dict[str, Any], List[Dict[str, Any]]]] = _BoundedDict(LAST_RESULTS_MAX)
+# Polled /offers/by-job and /offers/by-inquiry answers (see app.services.offers_read_cache)
+_offers_read_cache: Dict[Any, List[Dict[str, Any]]] = _read_cache(1024)
 
 # -------------------------------
 # Context from headers
@@ -299,7 +443,7 @@ def healthz():
         "ok": True,
         "app": APP_NAME,
         "version": APP_VERSION,
-        "model": os.getenv("GPT_MODEL", "gpt-4o-mini"),
+        "model": _GPT_MODEL,
         "supabase": bool(_supabase),
         "offers_table": _OFFERS_TABLE,
         "share_table": _SHARE_TABLE,
@@ -322,9 +466,80 @@ def root():
 def _make_doc_id(prefix: str, idx: int, filename: str) -> str:
     return f"{prefix}::{idx}::{_safe_filename(filename)}"
 
+
+def _has_pdf_header(f: UploadFile) -> bool:
+    """Peek at the spooled upload for the %PDF- marker (readers accept it within the first 1KB)."""
+    head = f.file.read(1024)
+    f.file.seek(0)
+    return b"%PDF-" in head
+
+
+def _check_upload(f: UploadFile) -> None:
+    """
+    Starlette already spools large uploads to disk, so oversized/empty files and
+    misnamed non-PDFs are rejected up front instead of being loaded (and sent to
+    the extractor) only to fail later.
+    """
+    if f.size is not None and (f.size == 0 or f.size > MAX_PDF_BYTES):
+        raise ExtractionError("PDF too large or empty (limit: 12MB)")
+    if not _has_pdf_header(f):
+        raise ExtractionError("Not a PDF file (missing %PDF- header)")
+
+
+async def _read_upload(f: UploadFile) -> bytes:
+    """Read an uploaded PDF into memory for the extractor."""
+    _check_upload(f)
+    return await f.read()
+
+
+_SENDFILE_TO_FILES = sys.platform.startswith("linux") and hasattr(os, "sendfile")
+
+
+def _copy_upload(f: UploadFile, dst) -> int:
+    """
+    Copy the whole upload into the open file dst and return its size. Once Starlette
+    has rolled the spool over to disk (uploads past MultiPartParser.max_file_size) the
+    copy is done in-kernel with sendfile() on Linux, so the PDF is not pushed through
+    Python buffers; small in-memory spools and other hosts use copyfileobj().
+    """
+    f.file.seek(0)
+    # Only Linux sendfile() writes to regular files (macOS/BSD require a socket), and the
+    # size check avoids fileno(), which would roll an in-memory spool over to disk.
+    if _SENDFILE_TO_FILES and f.size is not None and f.size > MultiPartParser.max_file_size:
+        try:
+            dst.flush()
+            in_fd, out_fd = f.file.fileno(), dst.fileno()
+            offset = 0
+            while True:
+                sent = os.sendfile(out_fd, in_fd, offset, 1 << 30)
+                if not sent:
+                    break
+                offset += sent
+            dst.seek(offset)
+            return offset
+        except (OSError, ValueError):
+            # e.g. a filesystem without sendfile support: redo the copy in user space
+            f.file.seek(0)
+            dst.seek(0)
+            dst.truncate()
+    shutil.copyfileobj(f.file, dst)
+    return dst.tell()
+
+
+def _spool_upload(f: UploadFile) -> str:
+    """
+    Copy an upload to a temp file that outlives the request (Starlette closes its
+    spool once the response is sent). Background workers read it when they start,
+    so queued jobs hold a path instead of the whole PDF in memory.
+    """
+    with tempfile.NamedTemporaryFile(prefix="offer-", suffix=".pdf", delete=False) as tmp:
+        _copy_upload(f, tmp)
+        return tmp.name
+
 # -------------------------------
 # Utilities
 # -------------------------------
+
 def _num(v: Any) -> Optional[float]:
     if v is None:
         return None
@@ -350,7 +565,38 @@ def _inject_meta(payload: Dict[str, Any], *, insurer: str, company: str, insured
     payload["insurer_hint"] = insurer or payload.get("insurer_hint") or "-"
     payload["company_name"] = company or payload.get("company_name") or "-"
     payload["employee_count"] = insured_count if isinstance(insured_count, int) else payload.get("employee_count")
-    payload["inquiry_id"] = int(inquiry_id) if str(inquiry_id).isdigit() else None
+    # isdecimal() accepts exactly what int() parses as digits (same set as re's \d)
+    payload["inquiry_id"] = int(inquiry_id) if inquiry_id and inquiry_id.isdecimal() else None
+
+
+def _store_result(doc_id: str, payload: Dict[str, Any]) -> None:
+    """Keep a payload in _LAST_RESULTS and index it under its inquiry (after the store, so
+    readers never see an indexed document that is not there yet)."""
+    _LAST_RESULTS[doc_id] = payload
+    inq = payload.get("inquiry_id")
+    if inq is None:
+        return
+    with _INQUIRY_DOCS_LOCK:
+        docs = _INQUIRY_DOCS.get(inq)
+        if docs is None:
+            docs = _INQUIRY_DOCS[inq] = {}
+        docs[doc_id] = None
+
+
+def _last_results_for_inquiry(inquiry_id: int) -> List[Dict[str, Any]]:
+    """Payloads of an inquiry still held in _LAST_RESULTS; evicted documents are pruned."""
+    with _INQUIRY_DOCS_LOCK:
+        docs = _INQUIRY_DOCS.get(inquiry_id)
+        if not docs:
+            return []
+        payloads = []
+        for doc_id in list(docs):
+            p = _LAST_RESULTS.get(doc_id)
+            if p is None:
+                del docs[doc_id]
+            elif p.get("inquiry_id") == inquiry_id:
+                payloads.append(p)
+        return payloads
 
 
 def _feature_value(x: Any) -> Any:
@@ -416,6 +662,8 @@ def _rows_for_offers_table(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
     inquiry_id = payload.get("inquiry_id")
     company_name = payload.get("company_name")
     employee_count = payload.get("employee_count")
+    # Per-document values are resolved once, not once per program row
+    employee_count = int(employee_count) if isinstance(employee_count, (int, float)) else None
     hint = payload.get("insurer_hint") or None
     org_id = payload.get("_org_id")
     created_by_user_id = payload.get("_user_id")
@@ -423,7 +671,10 @@ def _rows_for_offers_table(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
     rows: List[Dict[str, Any]] = []
     programs = payload.get("programs", []) or []
     if programs:
-        for prog in programs:
+        # The full payload goes on the first row only; the rest carry a small reference
+        # so the insert body does not repeat the whole document once per program.
+        raw_ref = {"document_id": doc_id, "original_filename": payload.get("original_filename")}
+        for n, prog in enumerate(programs):
             insurer_val = prog.get("insurer") or hint
             rows.append(
                 {
@@ -437,11 +688,11 @@ def _rows_for_offers_table(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
                     "premium_eur": _num(prog.get("premium_eur")),
                     "payment_method": prog.get("payment_method"),
                     "features": prog.get("features") or {},
-                    "raw_json": payload,
+                    "raw_json": payload if n == 0 else raw_ref,
                     "status": "parsed",
                     "error": None,
                     "company_name": company_name,
-                    "employee_count": int(employee_count) if isinstance(employee_count, (int, float)) else None,
+                    "employee_count": employee_count,
                     "org_id": org_id,
                     "created_by_user_id": created_by_user_id,
                 }
@@ -464,7 +715,7 @@ def _rows_for_offers_table(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
                 "status": "error",
                 "error": payload.get("_error") or "no programs",
                 "company_name": company_name,
-                "employee_count": int(employee_count) if isinstance(employee_count, (int, float)) else None,
+                "employee_count": employee_count,
                 "org_id": org_id,
                 "created_by_user_id": created_by_user_id,
             }
@@ -472,24 +723,34 @@ def _rows_for_offers_table(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
     return rows
 
 
+# Columns _aggregate_offers_rows reads; raw_json (the whole extraction payload) is left
+# out of offers selects that only feed the aggregation.
+_OFFERS_AGG_COLUMNS = (
+    "id,filename,status,error,inquiry_id,insurer,company_hint,company_name,employee_count,"
+    "program_code,base_sum_eur,premium_eur,payment_method,features"
+)
+
+
 def _aggregate_offers_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     grouped: Dict[str, Dict[str, Any]] = {}
     for r in rows:
         src = r.get("filename") or "-"
-        if src not in grouped:
-            grouped[src] = {
+        status = r.get("status") or "parsed"
+        g = grouped.get(src)
+        if g is None:
+            g = grouped[src] = {
                 "source_file": src,
                 "programs": [],
                 "inquiry_id": r.get("inquiry_id"),
-                "status": r.get("status") or "parsed",
+                "status": status,
                 "error": r.get("error"),
                 "company_hint": r.get("company_hint"),
                 "insurer_hint": r.get("insurer_hint") or r.get("insurer") or r.get("company_hint"),
                 "company_name": r.get("company_name"),
                 "employee_count": r.get("employee_count"),
             }
-        if (r.get("status") or "parsed") != "error":
-            grouped[src]["programs"].append(
+        if status != "error":
+            g["programs"].append(
                 {
                     "row_id": r.get("id"),
                     "insurer": r.get("insurer"),
@@ -500,9 +761,9 @@ def _aggregate_offers_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
                     "features": r.get("features") or {},
                 }
             )
-        if grouped[src]["status"] == "error" and (r.get("status") or "parsed") == "parsed":
-            grouped[src]["status"] = "parsed"
-            grouped[src]["error"] = None
+        if g["status"] == "error" and status == "parsed":
+            g["status"] = "parsed"
+            g["error"] = None
 
     for g in grouped.values():
         if not g["programs"] and not g.get("error"):
@@ -511,31 +772,150 @@ def _aggregate_offers_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return list(grouped.values())
 
 
+def _payload_rows(doc_id: str, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Offers rows of an in-memory payload, expanded once per payload object instead of
+    on every fallback read. Callers get shallow copies they may annotate (e.g. row ids).
+    """
+    hit = _PAYLOAD_ROWS.get(doc_id)
+    if hit is None or hit[0] is not payload:
+        hit = _PAYLOAD_ROWS[doc_id] = (payload, _rows_for_offers_table(payload))
+    return [dict(r) for r in hit[1]]
+
+
 def save_to_supabase(payload: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
     doc_id = payload.get("document_id") or payload.get("source_file") or "uploaded.pdf"
-    _LAST_RESULTS[doc_id] = payload
+    _store_result(doc_id, payload)
 
     if not _supabase:
+        _invalidate_offer_reads()
         return True, None
 
     try:
         rows = _rows_for_offers_table(payload)
-        _supabase.table(_OFFERS_TABLE).insert(rows).execute()
-
-        try:
-            q = _supabase.table(_OFFERS_TABLE).select("id").eq("filename", doc_id).order("id", desc=False).execute()
-            ids = [r["id"] for r in (q.data or []) if isinstance(r, dict) and "id" in r]
-            if ids:
-                _INSERTED_IDS[doc_id] = ids
-        except Exception:
-            pass
-
+        inserted = _insert_offer_rows(rows)
+        _PAYLOAD_ROWS[doc_id] = (payload, rows)
+        _remember_inserted_ids([doc_id], inserted)
         return True, None
     except Exception as e:
         payload["_error"] = f"supabase_insert: {e}"
-        _LAST_RESULTS[doc_id] = payload
-        print(f"[warn] Supabase insert failed for {doc_id}: {e}")
+        _PAYLOAD_ROWS.pop(doc_id, None)
+        _store_result(doc_id, payload)
+        logger.warning("Supabase insert failed for %s: %s", doc_id, e)
         return False, str(e)
+    finally:
+        # Only once the insert is done: a read in between must not re-cache the old state.
+        _invalidate_offer_reads()
+
+
+def save_many_to_supabase(payloads: List[Dict[str, Any]]) -> List[Tuple[bool, Optional[str]]]:
+    """
+    Insert the rows of several documents with a single PostgREST request.
+    The insert is one statement, so on failure nothing was written and each document
+    is retried on its own; a single bad payload then only fails itself.
+    """
+    if len(payloads) <= 1 or not _supabase:
+        return [save_to_supabase(p) for p in payloads]
+
+    doc_ids: List[str] = []
+    doc_rows: List[List[Dict[str, Any]]] = []
+    rows: List[Dict[str, Any]] = []
+    for p in payloads:
+        doc_id = p.get("document_id") or p.get("source_file") or "uploaded.pdf"
+        _store_result(doc_id, p)
+        doc_ids.append(doc_id)
+        doc_rows.append(_rows_for_offers_table(p))
+        rows.extend(doc_rows[-1])
+
+    try:
+        inserted = _insert_offer_rows(rows)
+    except Exception as e:
+        logger.warning("Supabase bulk insert of %d documents failed, retrying per document: %s", len(payloads), e)
+        return [save_to_supabase(p) for p in payloads]
+    _invalidate_offer_reads()
+
+    for doc_id, p, rs in zip(doc_ids, payloads, doc_rows):
+        _PAYLOAD_ROWS[doc_id] = (p, rs)
+    _remember_inserted_ids(doc_ids, inserted)
+    return [(True, None)] * len(payloads)
+
+
+def _insert_offer_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Insert offers rows and return id/filename of the new rows from the same request.
+    PostgREST applies ?select= to return=representation, so raw_json is not echoed back.
+    """
+    q = _offers_tbl.insert(rows, returning=ReturnMethod.representation)
+    q.params = q.params.set("select", "id,filename")
+    return q.execute().data or []
+
+
+def _remember_inserted_ids(doc_ids: List[str], inserted: List[Dict[str, Any]]) -> None:
+    """Cache offers row ids per document so fallback reads can keep their row_id."""
+    try:
+        if not inserted:
+            # Nothing came back with the insert; look the rows up instead
+            inserted = []
+            for chunk in _in_chunks(doc_ids):
+                q = _offers_tbl.select("id,filename").in_("filename", chunk).execute()
+                inserted.extend(q.data or [])
+        ids_by_doc: Dict[str, List[int]] = {}
+        for r in inserted:
+            if isinstance(r, dict) and "id" in r:
+                ids_by_doc.setdefault(r.get("filename"), []).append(r["id"])
+        for doc_id in doc_ids:
+            if ids_by_doc.get(doc_id):
+                _INSERTED_IDS[doc_id] = sorted(ids_by_doc[doc_id])
+    except Exception:
+        pass
+
+
+# Async-job workers finish documents independently; their inserts go through one writer
+# thread so saves that arrive while an insert is in flight share the next request.
+SUPABASE_INSERT_BATCH_DOCS = int(os.getenv("SUPABASE_INSERT_BATCH_DOCS", "20"))
+SUPABASE_INSERT_LINGER_S = float(os.getenv("SUPABASE_INSERT_LINGER_MS", "0")) / 1000
+
+
+class _OffersWriter:
+    """Group-commit writer: callers block until their document's rows are inserted."""
+
+    def __init__(self, max_docs: int, linger_s: float):
+        self.max_docs = max(1, max_docs)
+        self.linger_s = linger_s
+        self._queue: "queue.SimpleQueue[Tuple[Dict[str, Any], Future]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def save(self, payload: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+        if not _supabase:
+            return save_to_supabase(payload)
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="offers-writer", daemon=True)
+                self._thread.start()
+        fut: Future = Future()
+        self._queue.put((payload, fut))
+        return fut.result()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger_s
+            while len(batch) < self.max_docs:
+                try:
+                    wait = deadline - time.monotonic()
+                    batch.append(self._queue.get(timeout=wait) if wait > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                results = save_many_to_supabase([p for p, _ in batch])
+            except Exception as e:
+                results = [(False, str(e))] * len(batch)
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+
+_OFFERS_WRITER = _OffersWriter(SUPABASE_INSERT_BATCH_DOCS, SUPABASE_INSERT_LINGER_S)
 
 
 def _rows_from_fallback(doc_ids: List[str]) -> List[Dict[str, Any]]:
@@ -544,7 +924,7 @@ def _rows_from_fallback(doc_ids: List[str]) -> List[Dict[str, Any]]:
         p = _LAST_RESULTS.get(doc_id)
         if not p:
             continue
-        rs = _rows_for_offers_table(p)
+        rs = _payload_rows(doc_id, p)
         ids = _INSERTED_IDS.get(doc_id) or []
         if ids:
             k = 0
@@ -556,17 +936,66 @@ def _rows_from_fallback(doc_ids: List[str]) -> List[Dict[str, Any]]:
     return rows
 
 
+# PostgREST puts in.(...) filters in the URL; doc ids are ~60-100 chars each, so
+# long lists are split to stay well under proxy/URL length limits.
+SUPABASE_IN_CHUNK = int(os.getenv("SUPABASE_IN_CHUNK", "50"))
+
+
+def _in_chunks(values: List[str]) -> List[List[str]]:
+    if len(values) <= SUPABASE_IN_CHUNK:
+        return [values]
+    return [values[i : i + SUPABASE_IN_CHUNK] for i in range(0, len(values), SUPABASE_IN_CHUNK)]
+
+
+_MISSING_RELATION_CODES = {"42P01", "PGRST205"}
+_grouped_view_available = True
+
+
+def _grouped_offers_from_view(doc_ids: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetch already-aggregated groups from the offers_grouped view.
+    Returns None when the view cannot be queried so callers fall back to row aggregation.
+    """
+    global _grouped_view_available
+    if not (_supabase and _grouped_view_available):
+        return None
+    groups: List[Dict[str, Any]] = []
+    try:
+        for chunk in _in_chunks(doc_ids):
+            res = _supabase.table(_OFFERS_GROUPED_VIEW).select("*").in_("source_file", chunk).execute()
+            groups.extend(res.data or [])
+    except Exception as e:
+        # Undefined relation / not in the PostgREST schema cache: the migration has not
+        # been applied, so stop asking until restart. Other errors only skip this call.
+        if getattr(e, "code", None) in _MISSING_RELATION_CODES:
+            _grouped_view_available = False
+        logger.warning("%s select failed, aggregating rows in-process: %s", _OFFERS_GROUPED_VIEW, e)
+        return None
+    groups.sort(key=lambda g: g.get("first_row_id") or 0)
+    for g in groups:
+        g.pop("first_row_id", None)
+    return groups
+
+
 def _offers_by_document_ids(doc_ids: List[str]) -> List[Dict[str, Any]]:
     if not doc_ids:
         return []
+    doc_ids = list(dict.fromkeys(doc_ids))
+    agg = _grouped_offers_from_view(doc_ids)
+    if agg:
+        for obj in agg:
+            obj["_source"] = "supabase"
+        return agg
     rows: List[Dict[str, Any]] = []
     used_fallback = False
-    if _supabase:
+    # An empty answer from the view is authoritative; only re-read rows when it failed
+    if _supabase and agg is None:
         try:
-            res = _supabase.table(_OFFERS_TABLE).select("*").in_("filename", doc_ids).execute()
-            rows = res.data or []
+            for chunk in _in_chunks(doc_ids):
+                res = _offers_tbl.select(_OFFERS_AGG_COLUMNS).in_("filename", chunk).execute()
+                rows.extend(res.data or [])
         except Exception as e:
-            print(f"[warn] Supabase select failed: {e}")
+            logger.warning("Supabase select failed: %s", e)
             used_fallback = True
     if not rows:
         fb_rows = _rows_from_fallback(doc_ids)
@@ -579,6 +1008,19 @@ def _offers_by_document_ids(doc_ids: List[str]) -> List[Dict[str, Any]]:
     return agg
 
 
+def _cached_offers_by_document_ids(doc_ids: List[str]) -> List[Dict[str, Any]]:
+    """_offers_by_document_ids behind the short-lived read cache (for polled endpoints)."""
+    if OFFERS_READ_CACHE_TTL_S <= 0:
+        return _offers_by_document_ids(doc_ids)
+    # Keyed by the write generation seen before the read: an answer read across an
+    # insert is stored under the old generation and never served after the invalidation.
+    key = ("docs", tuple(doc_ids), _offers_generation())
+    agg = _offers_read_cache.get_fresh(key)
+    if agg is None:
+        agg = _offers_read_cache[key] = _offers_by_document_ids(doc_ids)
+    return agg
+
+
 def _derive_meta_from_offers(offers: List[Dict[str, Any]]) -> Tuple[Optional[str], Optional[int]]:
     company: Optional[str] = None
     employees: Optional[int] = None
@@ -594,6 +1036,30 @@ def _derive_meta_from_offers(offers: List[Dict[str, Any]]) -> Tuple[Optional[str
             break
     return company, employees
 
+# -------------------------------
+# Extraction cache
+# -------------------------------
+# The same quote PDF is often uploaded again (other inquiry, re-share, retry). Extractor
+# output is keyed by a hash of the bytes and kept serialized, so hits are decoded into a
+# fresh dict the caller can decorate with its own document id and meta.
+EXTRACT_CACHE_MAX = int(os.getenv("EXTRACT_CACHE_MAX", "256"))
+EXTRACT_CACHE_TTL_S = float(os.getenv("EXTRACT_CACHE_TTL_S", "86400"))
+_EXTRACT_CACHE: Dict[bytes, bytes] = _BoundedDict(max(EXTRACT_CACHE_MAX, 1), ttl_s=EXTRACT_CACHE_TTL_S)
+
+
+def _extract_cached(data: bytes, doc_id: str) -> Dict[str, Any]:
+    if EXTRACT_CACHE_MAX <= 0:
+        return extract_offer_from_pdf_bytes(data, document_id=doc_id)
+    key = hashlib.blake2b(data, digest_size=16).digest()
+    hit = _EXTRACT_CACHE.get_fresh(key)
+    if hit is not None:
+        payload = orjson.loads(hit)
+        payload["document_id"] = doc_id
+        return payload
+    payload = extract_offer_from_pdf_bytes(data, document_id=doc_id)
+    _EXTRACT_CACHE[key] = orjson.dumps(payload)
+    return payload
+
 # -------------------------------
 # Extract endpoints
 # -------------------------------
@@ -606,7 +1072,7 @@ async def extract_pdf(
     insured_count: int = Form(0),
     inquiry_id: str = Form(""),
 ):
-    if not (file.filename or "").lower().endswith(".pdf"):
+    if not _is_pdf_filename(file.filename) or not _has_pdf_header(file):
         raise HTTPException(status_code=415, detail="PDF required")
 
     org_id, user_id = _ctx_ids(request)
@@ -615,19 +1081,21 @@ async def extract_pdf(
     doc_id = _make_doc_id(batch_id, 1, file.filename or "uploaded.pdf")
     original_name = file.filename or "uploaded.pdf"
 
-    data = await file.read()
-    t0 = time.monotonic()
+    loop = asyncio.get_running_loop()
     try:
-        payload = extract_offer_from_pdf_bytes(data, document_id=doc_id)
+        data = await _read_upload(file)
+        t0 = time.monotonic()
+        # Extraction and the Supabase insert both block; keep them off the event loop
+        payload = await loop.run_in_executor(REQUEST_EXEC, _extract_cached, data, doc_id)
         payload["original_filename"] = original_name
         payload["_org_id"] = org_id
         payload["_user_id"] = user_id
 
         _inject_meta(payload, insurer=insurer, company=company, insured_count=insured_count, inquiry_id=inquiry_id)
-        ok, err = save_to_supabase(payload)
+        ok, err = await loop.run_in_executor(None, save_to_supabase, payload)
         payload["_timings"] = {"total_s": round(time.monotonic() - t0, 3)}
         payload["_persist"] = "supabase" if ok else f"fallback: {err}"
-        return JSONResponse({"document_id": doc_id, "result": payload})
+        return ORJSONResponse({"document_id": doc_id, "result": payload})
     except ExtractionError as e:
         payload = {
             "document_id": doc_id,
@@ -638,14 +1106,23 @@ async def extract_pdf(
             "_user_id": user_id,
         }
         _inject_meta(payload, insurer=insurer, company=company, insured_count=insured_count, inquiry_id=inquiry_id)
-        _LAST_RESULTS[doc_id] = payload
+        _store_result(doc_id, payload)
         raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
 
 
+MAX_UPLOAD_FILES = int(os.getenv("MAX_UPLOAD_FILES", "50"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", "/tmp")
+
+
 async def _parse_upload_form(request: Request) -> Dict[str, Any]:
-    form = await request.form()
+    # Refuse oversized bodies before Starlette spools every part
+    declared = request.headers.get("content-length") or ""
+    if declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload too large (limit: {MAX_UPLOAD_BYTES} bytes)")
+    form = await request.form(max_files=MAX_UPLOAD_FILES)
 
     files: List[UploadFile] = form.getlist("files")
     if not files:
@@ -671,22 +1148,22 @@ async def _parse_upload_form(request: Request) -> Dict[str, Any]:
         insurers = tmp
     if not insurers or len([x for x in insurers if x]) == 0:
         single_ins = str(form.get("insurer", "") or "").strip()
-        insurers = [single_ins for _ in range(len(files))]
-
-    if len(insurers) < len(files):
-        insurers += [""] * (len(files) - len(insurers))
-    elif len(insurers) > len(files):
-        insurers = insurers[: len(files)]
+        insurers = [single_ins] * len(files)
 
     return {
         "files": files,
-        "insurers": insurers,
+        "insurers": insurers,  # may be shorter/longer than files; pair with _with_insurers()
         "company": company,
         "insured_count": insured_cnt,
         "inquiry_id": inquiry_id,
     }
 
 
+def _with_insurers(files: List[UploadFile], insurers: List[str]):
+    """Pair each file with its insurer hint; missing hints are "" and extras are ignored."""
+    return zip(files, chain(insurers, repeat("")))
+
+
 @app.post("/extract/multiple")
 async def extract_multiple(request: Request):
     org_id, user_id = _ctx_ids(request)
@@ -699,46 +1176,99 @@ async def extract_multiple(request: Request):
     inquiry_id: str = parsed["inquiry_id"]
 
     batch_id = str(uuid.uuid4())
-    results: List[Dict[str, Any]] = []
-    doc_ids: List[str] = []
+    loop = asyncio.get_running_loop()
+    # REQUEST_EXEC already caps request extractions process-wide; this also keeps the
+    # request from reading every upload into memory up front and parking the bytes in
+    # the executor queue.
+    slots = asyncio.Semaphore(REQUEST_EXTRACT_WORKERS)
 
-    for idx, f in enumerate(files, start=1):
+    async def _extract_one(idx: int, f: UploadFile, insurer: str) -> Tuple[Dict[str, Any], Optional[str]]:
         filename = f.filename or "uploaded.pdf"
-        if not filename.lower().endswith(".pdf"):
-            results.append({"document_id": filename, "error": "Unsupported file type (only PDF)"})
-            continue
+        if not _is_pdf_filename(filename):
+            return {"document_id": filename, "error": "Unsupported file type (only PDF)"}, None
+        doc_id = _make_doc_id(batch_id, idx, filename)
         try:
-            doc_id = _make_doc_id(batch_id, idx, filename)
-            original_name = filename
-            data = await f.read()
-            t0 = time.monotonic()
-            payload = extract_offer_from_pdf_bytes(data, document_id=doc_id)
-            payload["original_filename"] = original_name
+            async with slots:
+                data = await _read_upload(f)
+                t0 = time.monotonic()
+                payload = await loop.run_in_executor(REQUEST_EXEC, _extract_cached, data, doc_id)
+                del data
+            # This file's own work, taken as it finishes (not after the other files / the save)
+            payload["_timings"] = {"total_s": round(time.monotonic() - t0, 3)}
+            payload["original_filename"] = filename
             payload["_org_id"] = org_id
             payload["_user_id"] = user_id
-            _inject_meta(payload, insurer=insurers[idx - 1] or "", company=company, insured_count=insured_count, inquiry_id=inquiry_id)
-            ok, err = save_to_supabase(payload)
-            payload["_persist"] = "supabase" if ok else f"fallback: {err}"
-            payload["_timings"] = {"total_s": round(time.monotonic() - t0, 3)}
-            results.append(payload)
-            doc_ids.append(doc_id)
+            _inject_meta(payload, insurer=insurer, company=company, insured_count=insured_count, inquiry_id=inquiry_id)
+            return payload, doc_id
         except ExtractionError as e:
-            err_doc_id = locals().get("doc_id", f"{batch_id}::{idx}::{_safe_filename(filename)}")
             payload = {
-                "document_id": err_doc_id,
+                "document_id": doc_id,
                 "original_filename": filename,
                 "programs": [],
                 "_error": f"ExtractionError: {e}",
                 "_org_id": org_id,
                 "_user_id": user_id,
             }
-            _inject_meta(payload, insurer=insurers[idx - 1] or "", company=company, insured_count=insured_count, inquiry_id=inquiry_id)
-            _LAST_RESULTS[err_doc_id] = payload
-            results.append(payload)
+            _inject_meta(payload, insurer=insurer, company=company, insured_count=insured_count, inquiry_id=inquiry_id)
+            _store_result(doc_id, payload)
+            return payload, None
         except Exception as e:
-            results.append({"document_id": filename, "error": f"Unexpected error: {e}"})
+            return {"document_id": filename, "error": f"Unexpected error: {e}"}, None
 
-    return JSONResponse({"documents": doc_ids, "results": results})
+    # Files are independent: run them concurrently on the extractor pool and keep upload order.
+    t_batch = time.monotonic()
+    outcomes = await asyncio.gather(
+        *(_extract_one(idx, f, ins) for idx, (f, ins) in enumerate(_with_insurers(files, insurers), start=1))
+    )
+    results: List[Dict[str, Any]] = [payload for payload, _ in outcomes]
+    doc_ids: List[str] = [doc_id for _, doc_id in outcomes if doc_id]
+
+    # One insert for the whole upload instead of a PostgREST round-trip per document
+    extracted = [payload for payload, doc_id in outcomes if doc_id]
+    t_db0 = time.monotonic()
+    saved = await loop.run_in_executor(None, save_many_to_supabase, extracted)
+    t_end = time.monotonic()
+    # The insert is shared by the whole upload: reported as batch timings, not per file
+    batch_timings = {"db_s": round(t_end - t_db0, 3), "batch_s": round(t_end - t_batch, 3)}
+    for payload, (ok, err) in zip(extracted, saved):
+        payload["_persist"] = "supabase" if ok else f"fallback: {err}"
+        payload["_timings"].update(batch_timings)
+
+    return ORJSONResponse({"documents": doc_ids, "results": results})
+
+
+def _persist_batch_file(
+    f: UploadFile,
+    filename: str,
+    insurer: str,
+    org_id: Optional[int],
+    user_id: Optional[int],
+    batch_id: int,
+    batch_token: str,
+) -> None:
+    batch_dir = os.path.join(STORAGE_ROOT, "offers", batch_token)
+    os.makedirs(batch_dir, exist_ok=True)
+    safe_name = _safe_filename(filename)
+    abs_path = os.path.join(batch_dir, safe_name)
+    # Copy from Starlette's spool so files we did not load are still persisted
+    with open(abs_path, "wb") as wf:
+        size_bytes = _copy_upload(f, wf)
+    print("[sidecar] saved", abs_path)
+
+    # Insert offer_files row
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO public.offer_files
+                (org_id, created_by_user_id, batch_id, filename, mime_type, size_bytes, storage_path, insurer_code, is_permanent, product_line)
+                VALUES
+                (%s,%s,%s,%s,%s,%s,%s,%s,false,NULL)
+                """,
+                (org_id, user_id, batch_id, safe_name, f.content_type or "application/pdf", size_bytes, abs_path, insurer or None),
+            )
+            conn.commit()
+    print("[sidecar] offer-file-inserted", safe_name)
 
 
 @app.post("/extract/multiple-async", status_code=202)
@@ -755,14 +1285,18 @@ async def extract_multiple_async(request: Request, background_tasks: BackgroundT
 
     job_id = str(uuid.uuid4())
     with _JOBS_LOCK:
-        _jobs[job_id] = {"total": len(files), "done": 0, "errors": [], "docs": [], "timings": {}}
+        _jobs[job_id] = {"total": len(files), "done": 0, "version": 0, "errors": [], "docs": [], "timings": {}}
+
+    loop = asyncio.get_running_loop()
 
-    # Create batch for sidecar (once per job)
+    # Create batch for sidecar (once per job); psycopg2 blocks, so keep it off the event loop
     batch_id = None
     batch_token = None
     if org_id and user_id:
         try:
-            batch_token, batch_id = create_offer_batch(org_id, user_id, title=f"PAS Upload - {company or 'Unknown'}")
+            batch_token, batch_id = await loop.run_in_executor(
+                None, create_offer_batch, org_id, user_id, f"PAS Upload - {company or 'Unknown'}"
+            )
             print("[sidecar] batch-created", batch_id, batch_token)
         except Exception as e:
             print(f"[sidecar] Failed to create batch: {e}")
@@ -771,47 +1305,55 @@ async def extract_multiple_async(request: Request, background_tasks: BackgroundT
     else:
         print("[sidecar] skip batch: missing org/user")
 
-    doc_ids: List[str] = []
+    pairs = list(_with_insurers(files, insurers))
+    doc_ids: List[str] = [_make_doc_id(job_id, idx, f.filename or "uploaded.pdf") for idx, (f, _) in enumerate(pairs, start=1)]
+    with _JOBS_LOCK:
+        rec = _jobs.get(job_id)
+        if rec is not None:
+            rec["docs"] = doc_ids
 
-    for idx, f in enumerate(files, start=1):
+    async def _accept_one(f: UploadFile, insurer: str, doc_id: str) -> None:
         filename = f.filename or "uploaded.pdf"
-        doc_id = _make_doc_id(job_id, idx, filename)
-        doc_ids.append(doc_id)
-        data = await f.read()
+        try:
+            _check_upload(f)
+            accepted = True
+        except ExtractionError as e:
+            accepted = False
+            payload = {
+                "document_id": doc_id,
+                "original_filename": filename,
+                "programs": [],
+                "_error": f"extract: {e}",
+                "_org_id": org_id,
+                "_user_id": user_id,
+            }
+            _inject_meta(payload, insurer=insurer, company=company, insured_count=insured_count, inquiry_id=inquiry_id)
+            # Saved as an error row so a job rebuilt from the DB still counts this upload
+            await loop.run_in_executor(None, _OFFERS_WRITER.save, payload)
+            with _JOBS_LOCK:
+                rec = _jobs.get(job_id)
+                if rec is not None:
+                    rec["errors"].append({"document_id": doc_id, "error": f"extract: {e}"})
+                    rec["done"] += 1
+                    rec["version"] += 1
 
         # Persist the file to disk + offer_files row
         if batch_id is not None:
-            STORAGE_ROOT = os.getenv("STORAGE_ROOT", "/tmp")
-            batch_dir = os.path.join(STORAGE_ROOT, "offers", batch_token)
-            os.makedirs(batch_dir, exist_ok=True)
-            safe_name = _safe_filename(filename)
-            abs_path = os.path.join(batch_dir, safe_name)
-            with open(abs_path, "wb") as wf:
-                wf.write(data)
-            print("[sidecar] saved", abs_path)
-
-            # Insert offer_files row
-            with get_db_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        INSERT INTO public.offer_files
-                        (org_id, created_by_user_id, batch_id, filename, mime_type, size_bytes, storage_path, insurer_code, is_permanent, product_line)
-                        VALUES
-                        (%s,%s,%s,%s,%s,%s,%s,%s,false,NULL)
-                        """,
-                        (org_id, user_id, batch_id, safe_name, f.content_type or "application/pdf", len(data), abs_path, insurers[idx - 1] or None),
-                    )
-                    conn.commit()
-            print("[sidecar] offer-file-inserted", safe_name)
+            await loop.run_in_executor(
+                None, _persist_batch_file, f, filename, insurer, org_id, user_id, batch_id, batch_token
+            )
         else:
             print("[sidecar] skip persist: no batch_id")
 
+        if not accepted:
+            return
+
+        pdf_path = await loop.run_in_executor(None, _spool_upload, f)
         EXEC.submit(
             _process_pdf_bytes,
-            data=data,
+            pdf_path=pdf_path,
             doc_id=doc_id,
-            insurer=insurers[idx - 1] or "",
+            insurer=insurer,
             company=company,
             insured_count=insured_count,
             job_id=job_id,
@@ -822,18 +1364,19 @@ async def extract_multiple_async(request: Request, background_tasks: BackgroundT
             user_id=user_id,
         )
 
-    with _JOBS_LOCK:
-        _jobs[job_id]["docs"] = doc_ids
+    # Each file's disk copies and offer_files insert block; run them side by side in
+    # threads so the client gets its job_id after the slowest file, not the sum of all.
+    await asyncio.gather(*(_accept_one(f, ins, doc_id) for (f, ins), doc_id in zip(pairs, doc_ids)))
 
     if batch_id and org_id:
-        background_tasks.add_task(run_batch_ingest_sidecar, org_id, batch_id)
+        background_tasks.add_task(SIDECAR_EXEC.submit, run_batch_ingest_sidecar, org_id, batch_id)
         print("[sidecar] scheduled", batch_id)
 
     return {"job_id": job_id, "accepted": len(files), "documents": doc_ids}
 
 
 def _process_pdf_bytes(
-    data: bytes,
+    pdf_path: str,
     doc_id: str,
     insurer: str,
     company: str,
@@ -852,9 +1395,16 @@ def _process_pdf_bytes(
             rec.setdefault("timings", {})
             rec["timings"].setdefault(doc_id, {})["queue_s"] = round(t_start - float(enq_ts), 3)
 
+    # Outcome is published to the job record in one critical section (see finally), so
+    # /jobs never shows a document counted as done without its error/timings or vice versa.
+    error: Optional[str] = None
+    timings: Dict[str, float] = {}
     try:
+        with open(pdf_path, "rb") as fh:
+            data = fh.read()
         t_llm0 = time.monotonic()
-        payload = extract_offer_from_pdf_bytes(data, document_id=doc_id)
+        payload = _extract_cached(data, doc_id)
+        del data
         t_llm = time.monotonic() - t_llm0
 
         t_db0 = time.monotonic()
@@ -862,53 +1412,134 @@ def _process_pdf_bytes(
         payload["_org_id"] = org_id
         payload["_user_id"] = user_id
         _inject_meta(payload, insurer=insurer, company=company, insured_count=insured_count, inquiry_id=inquiry_id_raw)
-        ok, err = save_to_supabase(payload)
+        ok, err = _OFFERS_WRITER.save(payload)
         t_db = time.monotonic() - t_db0
 
-        payload["_timings"] = {
+        timings = payload["_timings"] = {
             "llm_s": round(t_llm, 3),
             "db_s": round(t_db, 3),
             "total_s": round(time.monotonic() - t_start, 3),
         }
-        _LAST_RESULTS[doc_id] = payload
-
-        with _JOBS_LOCK:
-            rec = _jobs.get(job_id)
-            if rec is not None:
-                rec["timings"].setdefault(doc_id, {}).update(payload["_timings"])
-                if not ok:
-                    rec["errors"].append({"document_id": doc_id, "error": f"supabase_insert: {err}"})
+        _store_result(doc_id, payload)
+        if not ok:
+            error = f"supabase_insert: {err}"
     except Exception as e:
-        with _JOBS_LOCK:
-            rec = _jobs.get(job_id)
-            if rec is not None:
-                rec["errors"].append({"document_id": doc_id, "error": f"extract: {e}"})
-                rec["timings"].setdefault(doc_id, {})["total_s"] = round(time.monotonic() - t_start, 3)
+        error = f"extract: {e}"
+        timings = {"total_s": round(time.monotonic() - t_start, 3)}
         payload = {
             "document_id": doc_id,
             "original_filename": original_name,
             "programs": [],
-            "_error": f"extract: {e}",
-            "_timings": {"total_s": round(time.monotonic() - t_start, 3)},
+            "_error": error,
+            "_timings": dict(timings),
             "_org_id": org_id,
             "_user_id": user_id,
         }
         _inject_meta(payload, insurer=insurer, company=company, insured_count=insured_count, inquiry_id=inquiry_id_raw)
-        _LAST_RESULTS[doc_id] = payload
+        # Saved as an error row so a job rebuilt from the DB still counts this document
+        _OFFERS_WRITER.save(payload)
     finally:
+        try:
+            os.unlink(pdf_path)
+        except OSError:
+            pass
         with _JOBS_LOCK:
             rec = _jobs.get(job_id)
             if rec is not None:
+                rec["timings"].setdefault(doc_id, {}).update(timings)
+                if error:
+                    rec["errors"].append({"document_id": doc_id, "error": error})
                 rec["done"] += 1
+                rec["version"] += 1
 
 
-@app.get("/jobs/{job_id}")
-def job_status(job_id: str):
+def _job_from_offers(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Rebuild a job record from its offers rows once the in-memory one is gone (restart,
+    eviction, or a job run by another worker). Document ids start with the job id;
+    rejected uploads and failed extractions are saved as error rows. Documents not saved
+    yet are not known here, so the record counts what was saved as done and is flagged
+    `rebuilt` for clients.
+    """
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None
+    if not _supabase:
+        return None
+    rows: List[Dict[str, Any]] = []
+    try:
+        # Paged until an empty page, so a PostgREST max-rows cap cannot truncate the job
+        while True:
+            res = (
+                _offers_tbl.select("filename,status,error")
+                .like("filename", f"{job_id}::*")
+                .order("id")
+                .range(len(rows), len(rows) + _JOB_ROWS_PAGE - 1)
+                .execute()
+            )
+            if not res.data:
+                break
+            rows.extend(res.data)
+    except Exception as e:
+        logger.warning("offers lookup for job %s failed: %s", job_id, e)
+        return None
+
+    docs: Dict[str, None] = {}
+    errors: List[Dict[str, Any]] = []
+    for r in rows:
+        doc_id = r.get("filename")
+        if not doc_id or doc_id in docs:
+            continue
+        docs[doc_id] = None
+        if r.get("status") == "error":
+            errors.append({"document_id": doc_id, "error": r.get("error")})
+    if not docs:
+        _REBUILT_JOBS[job_id] = False
+        return None
+
+    def _idx(doc_id: str) -> int:
+        part = doc_id.split("::")[1]
+        return int(part) if part.isdecimal() else 0
+
+    doc_ids = sorted(docs, key=_idx)
+    job = _REBUILT_JOBS[job_id] = {
+        "total": len(doc_ids),
+        "done": len(doc_ids),
+        "version": 0,
+        "errors": errors,
+        "docs": doc_ids,
+        "timings": {},
+        "rebuilt": True,
+    }
+    return job
+
+
+def _load_job(job_id: str) -> Optional[Dict[str, Any]]:
     with _JOBS_LOCK:
         job = _jobs.get(job_id)
-        if not job:
-            raise HTTPException(status_code=404, detail="job not found")
+    if job is not None:
         return job
+    cached = _REBUILT_JOBS.get_fresh(job_id)
+    if cached is not None:
+        return cached or None  # False: the id has no offers rows
+    return _job_from_offers(job_id)
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = _load_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    with _JOBS_LOCK:
+        # Workers keep mutating the record; the response is serialized after the lock is
+        # released, so hand out a copy taken while counts/errors/timings are consistent.
+        return {
+            **job,
+            "errors": list(job.get("errors") or []),
+            "docs": list(job.get("docs") or []),
+            "timings": {k: dict(v) for k, v in (job.get("timings") or {}).items()},
+        }
 
 # -------------------------------
 # Templates API (create/list/instantiate)
@@ -988,7 +1619,8 @@ def instantiate_template(template_id: int, request: Request, company: str = Form
         "org_id": org_id,
         "created_by_user_id": user_id,
     }
-    _supabase.table(_OFFERS_TABLE).insert(row).execute()
+    _offers_tbl.insert(row, returning=ReturnMethod.minimal).execute()
+    _invalidate_offer_reads()
 
     try:
         _supabase.rpc("increment_template_usage", {"t_id": template_id}).execute()
@@ -1001,13 +1633,27 @@ def instantiate_template(template_id: int, request: Request, company: str = Form
 # Read/Update offers
 # -------------------------------
 @app.get("/offers/by-job/{job_id}")
-def offers_by_job(job_id: str):
-    with _JOBS_LOCK:
-        job = _jobs.get(job_id)
+def offers_by_job(job_id: str, request: Request):
+    job = _load_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
-    doc_ids = job.get("docs") or []
-    return _offers_by_document_ids(doc_ids)
+    with _JOBS_LOCK:
+        # done counts documents whose save has finished; before the first one there is
+        # nothing in the DB or in memory to look up yet.
+        doc_ids = (job.get("docs") or []) if job.get("done") else []
+        # Taken before reading offers: a write racing the read changes the next ETag.
+        # Version and generation only see this process' writes, so the tag is sent only
+        # while the job runs here; once it is done (or rebuilt from the DB), edits made
+        # through other workers must not be answered with 304.
+        running = not job.get("rebuilt") and job.get("done", 0) < job.get("total", 0)
+        etag = f'W/"{job_id}-{job.get("version", 0)}-{_offers_generation()}"' if running else None
+    # The job page polls this while the job runs; unchanged polls skip the DB read.
+    if etag is not None and etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    # Offers are plain JSON from PostgREST / the extractor: render directly with orjson
+    # instead of letting FastAPI walk every features dict through jsonable_encoder first.
+    headers = {"ETag": etag} if etag is not None else None
+    return ORJSONResponse(_cached_offers_by_document_ids(doc_ids), headers=headers)
 
 
 class OfferUpdateBody(BaseModel):
@@ -1018,6 +1664,9 @@ class OfferUpdateBody(BaseModel):
     insurer: Optional[str] = None
     program_code: Optional[str] = None
 
+# Fields coerced before the update; the rest of OfferUpdateBody is written as given
+_OFFER_UPDATE_COERCERS = {"premium_eur": _num, "base_sum_eur": _num}
+
 # -------------------------------
 # Share links
 # -------------------------------
@@ -1028,17 +1677,19 @@ def _load_share_record(token: str, attempts: int = 25, delay_s: float = 0.2) ->
     if _supabase:
         for i in range(max(1, attempts)):
             try:
-                res = _supabase.table(_SHARE_TABLE).select("*").eq("token", token).limit(1).execute()
+                res = _shares_tbl.select("*").eq("token", token).limit(1).execute()
                 rows = res.data or []
                 if rows:
                     return rows[0]
             except Exception as e:
-                print(f"[warn] share select failed (attempt {i+1}/{attempts}): {e}")
+                logger.warning("share select failed (attempt %d/%d): %s", i + 1, attempts, e)
             if i + 1 < attempts:
                 time.sleep(delay_s)
     return _SHARES_FALLBACK.get(token)
 
 
+# Every share read/edit re-checks expiry against the same stored string; parse it once.
+@lru_cache(maxsize=4096)
 def _parse_to_utc_naive(s: Optional[str]) -> Optional[datetime]:
     if not s:
         return None
@@ -1071,7 +1722,9 @@ def _bump_share_edit(token: Optional[str]) -> None:
         return
     try:
         if _supabase:
-            _supabase.table(_SHARE_TABLE).update({"last_edited_at": datetime.utcnow().isoformat() + "Z"}).eq("token", token).execute()
+            _shares_tbl.update(
+                {"last_edited_at": datetime.utcnow().isoformat() + "Z"}, returning=ReturnMethod.minimal
+            ).eq("token", token).execute()
 
         # Manual SQL fallback to increment edit_count too
         try:
@@ -1089,9 +1742,9 @@ def _bump_share_edit(token: Optional[str]) -> None:
                 conn.commit()
             conn.close()
         except Exception as e:
-            print(f"[warn] local bump share edit failed (fallback) for token {token}: {e}")
+            logger.warning("local bump share edit failed (fallback) for token %s: %s", token, e)
     except Exception as e:
-        print(f"[warn] Supabase bump share edit failed for token {token}: {e}")
+        logger.warning("Supabase bump share edit failed for token %s: %s", token, e)
 
 
 @app.delete("/offers/{offer_id}")
@@ -1101,11 +1754,13 @@ def delete_offer(offer_id: int, x_share_token: Optional[str] = Header(default=No
     if not _supabase:
         raise HTTPException(status_code=503, detail="DB not configured")
     try:
-        _supabase.table(_OFFERS_TABLE).delete().eq("id", offer_id).execute()
+        _offers_tbl.delete(returning=ReturnMethod.minimal).eq("id", offer_id).execute()
+        _invalidate_offer_reads()
         _bump_share_edit(x_share_token)
 
         for doc_id, ids in list(_INSERTED_IDS.items()):
-            _INSERTED_IDS[doc_id] = [i for i in ids if i != offer_id]
+            if offer_id in ids:
+                _INSERTED_IDS[doc_id] = [i for i in ids if i != offer_id]
         return {"ok": True, "deleted": offer_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"delete failed: {e}")
@@ -1122,36 +1777,22 @@ def update_offer(
     if not _supabase:
         raise HTTPException(status_code=503, detail="DB not configured")
 
-    updates: Dict[str, Any] = {}
-
-    if body.premium_eur is not None:
-        v = _num(body.premium_eur)
-        if v is None:
-            raise HTTPException(status_code=400, detail="premium_eur must be numeric")
-        updates["premium_eur"] = v
-
-    if body.base_sum_eur is not None:
-        v = _num(body.base_sum_eur)
-        if v is None:
-            raise HTTPException(status_code=400, detail="base_sum_eur must be numeric")
-        updates["base_sum_eur"] = v
-
-    if body.payment_method is not None:
-        updates["payment_method"] = body.payment_method
-    if body.features is not None:
-        updates["features"] = body.features
-    if body.insurer is not None:
-        updates["insurer"] = body.insurer
-    if body.program_code is not None:
-        updates["program_code"] = body.program_code
+    updates: Dict[str, Any] = body.model_dump(exclude_none=True)
+    for field, coerce in _OFFER_UPDATE_COERCERS.items():
+        if field in updates:
+            v = coerce(updates[field])
+            if v is None:
+                raise HTTPException(status_code=400, detail=f"{field} must be numeric")
+            updates[field] = v
 
     if not updates:
         raise HTTPException(status_code=400, detail="no changes provided")
 
     try:
-        _supabase.table(_OFFERS_TABLE).update(updates).eq("id", offer_id).execute()
-        sel = _supabase.table(_OFFERS_TABLE).select("*").eq("id", offer_id).limit(1).execute()
-        rows = sel.data or []
+        # PostgREST returns the updated row (return=representation); no second select
+        res = _offers_tbl.update(updates).eq("id", offer_id).execute()
+        _invalidate_offer_reads()
+        rows = res.data or []
         if not rows:
             raise HTTPException(status_code=404, detail="offer not found")
         _bump_share_edit(x_share_token)
@@ -1164,20 +1805,25 @@ def update_offer(
 
 @app.get("/offers/by-inquiry/{inquiry_id}")
 def offers_by_inquiry(inquiry_id: int):
+    key = ("inquiry", inquiry_id, _offers_generation())
+    cached = _offers_read_cache.get_fresh(key) if OFFERS_READ_CACHE_TTL_S > 0 else None
+    if cached is not None:
+        return ORJSONResponse(cached)
     if _supabase:
         try:
-            res = _supabase.table(_OFFERS_TABLE).select("*").eq("inquiry_id", inquiry_id).execute()
+            res = _offers_tbl.select(_OFFERS_AGG_COLUMNS).eq("inquiry_id", inquiry_id).execute()
             rows = res.data or []
         except Exception as e:
-            print(f"[warn] Supabase by-inquiry failed: {e}")
+            logger.warning("Supabase by-inquiry failed: %s", e)
             rows = []
     else:
         rows = []
-    for p in _LAST_RESULTS.values():
-        for r in _rows_for_offers_table(p):
-            if r.get("inquiry_id") == inquiry_id:
-                rows.append(r)
-    return _aggregate_offers_rows(rows)
+    for p in _last_results_for_inquiry(inquiry_id):
+        rows.extend(_payload_rows(p.get("document_id"), p))
+    agg = _aggregate_offers_rows(rows)
+    if OFFERS_READ_CACHE_TTL_S > 0:
+        _offers_read_cache[key] = agg
+    return ORJSONResponse(agg)
 
 # -------------------------------
 # Share APIs
@@ -1226,8 +1872,26 @@ def _share_is_editable(rec: Dict[str, Any], *, field: Optional[str] = None) -> N
         raise HTTPException(status_code=403, detail=f"Field '{field}' is not allowed to edit")
 
 
+_TOKEN_BYTES = 16
+_TOKEN_BATCH = 64
+# Filled lazily (never at import) so forked workers do not share pre-generated tokens
+_TOKEN_POOL: deque = deque()
+# Inserts retried with a fresh token when share_links.token is already taken
+_SHARE_TOKEN_ATTEMPTS = 3
+
+
 def _gen_token() -> str:
-    return secrets.token_urlsafe(16)
+    """Same format as secrets.token_urlsafe(16), with entropy read in batches of 64 tokens."""
+    try:
+        return _TOKEN_POOL.popleft()
+    except IndexError:
+        raw = os.urandom(_TOKEN_BYTES * _TOKEN_BATCH)
+        tokens = [
+            base64.urlsafe_b64encode(raw[i : i + _TOKEN_BYTES]).rstrip(b"=").decode("ascii")
+            for i in range(0, len(raw), _TOKEN_BYTES)
+        ]
+        _TOKEN_POOL.extend(tokens[1:])
+        return tokens[0]
 
 
 def _infer_file_ids_from_document_ids(doc_ids: List[str], org_id: Optional[int] = None) -> List[int]:
@@ -1374,7 +2038,7 @@ def create_share_token_only(body: ShareCreateBody, request: Request):
             cached_offers = raw_offers
             cached_comparison = comparison
         except Exception as e:
-            print("CASCO preload failed:", e)
+            logger.warning("CASCO preload failed: %s", e)
         finally:
             try:
                 conn.close()
@@ -1424,14 +2088,23 @@ def create_share_token_only(body: ShareCreateBody, request: Request):
     }
 
     if _supabase:
-        try:
-            _supabase.table(_SHARE_TABLE).insert(row).execute()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Share create failed: {e}")
+        for attempt in range(_SHARE_TOKEN_ATTEMPTS):
+            try:
+                _shares_tbl.insert(row, returning=ReturnMethod.minimal).execute()
+                break
+            except Exception as e:
+                # 23505 = unique_violation on share_links.token: draw a new token and retry
+                if getattr(e, "code", None) == "23505" and attempt + 1 < _SHARE_TOKEN_ATTEMPTS:
+                    token = row["token"] = _gen_token()
+                    continue
+                raise HTTPException(status_code=500, detail=f"Share create failed: {e}")
+    else:
+        while token in _SHARES_FALLBACK:
+            token = row["token"] = _gen_token()
 
     _SHARES_FALLBACK[token] = row
 
-    base = os.getenv("SHARE_BASE_URL")
+    base = _SHARE_BASE_URL
     if base:
         url = f"{base.rstrip('/')}/share/{token}"
     else:
@@ -1480,7 +2153,7 @@ def get_share_token_only(token: str, request: Request):
                     updated_stats = dict(row)
                 conn.commit()
         except Exception as e:
-            print(f"[warn] Failed to increment views_count for token {token}: {e}")
+            logger.warning("Failed to increment views_count for token %s: %s", token, e)
             updated_stats = {
                 "views_count": share.get("views_count", 0),
                 "edit_count": share.get("edit_count", 0),
@@ -1521,7 +2194,7 @@ def get_share_token_only(token: str, request: Request):
         offers = payload["results"]
     elif mode == "by-documents":
         doc_ids = payload.get("document_ids") or []
-        offers = _offers_by_document_ids(doc_ids)
+        offers = _cached_offers_by_document_ids(doc_ids)
     else:
         offers = []
 
@@ -1648,13 +2321,13 @@ def update_share_token_only(token: str, body: ShareUpdateBody, request: Request)
         finally:
             conn.close()
     except Exception as e:
-        print(f"[warn] Failed to update share and increment edit_count for token {token}: {e}")
+        logger.warning("Failed to update share and increment edit_count for token %s: %s", token, e)
         if _supabase:
             try:
                 upd_fields: Dict[str, Any] = {"payload": payload}
                 if body.view_prefs is not None:
                     upd_fields["view_prefs"] = body.view_prefs
-                _supabase.table(_SHARE_TABLE).update(upd_fields).eq("token", token).execute()
+                _shares_tbl.update(upd_fields, returning=ReturnMethod.minimal).eq("token", token).execute()
             except Exception as e2:
                 raise HTTPException(status_code=500, detail=f"Share update failed: {e2}")
         else:
@@ -1675,7 +2348,8 @@ def update_share_token_only(token: str, body: ShareUpdateBody, request: Request)
                 if body.employees_count is not None:
                     upd["employee_count"] = int(body.employees_count)
                 if upd:
-                    _supabase.table(_OFFERS_TABLE).update(upd).in_("filename", doc_ids).execute()
+                    for chunk in _in_chunks(doc_ids):
+                        _offers_tbl.update(upd, returning=ReturnMethod.minimal).in_("filename", chunk).execute()
             for d in payload.get("document_ids") or []:
                 p = _LAST_RESULTS.get(d)
                 if p:
@@ -1683,8 +2357,10 @@ def update_share_token_only(token: str, body: ShareUpdateBody, request: Request)
                         p["company_name"] = body.company_name
                     if body.employees_count is not None:
                         p["employee_count"] = int(body.employees_count)
+                    _PAYLOAD_ROWS.pop(d, None)
+            _invalidate_offer_reads()
         except Exception as e:
-            print(f"[warn] offers propagation failed: {e}")
+            logger.warning("offers propagation failed: %s", e)
 
     response_payload = {
         "company_name": payload.get("company_name"),
@@ -1726,7 +2402,7 @@ def post_update_share_token_only(token: str, body: ShareUpdateBody, request: Req
 
 
 @app.get("/shares/{token}/qa")
-async def list_share_qa_public(token: str, limit: int = 200, offset: int = 0):
+def list_share_qa_public(token: str, limit: int = 200, offset: int = 0):
     if not _supabase:
         raise HTTPException(status_code=503, detail="Database not available")
 
@@ -1761,7 +2437,7 @@ async def list_share_qa_public(token: str, limit: int = 200, offset: int = 0):
 # User Invitation Endpoint
 # -------------------------------
 @app.post("/api/users/invite")
-async def invite_user_endpoint(
+def invite_user_endpoint(
     email: str = Body(..., embed=True),
     redirect_url: Optional[str] = Body(None, embed=True),
 ):
@@ -1783,7 +2459,7 @@ async def invite_user_endpoint(
 @app.get("/debug/last-results")
 def debug_last_results():
     out = []
-    for doc_id, p in _LAST_RESULTS.items():
+    for doc_id, p in list(_LAST_RESULTS.items()):
         status = "parsed" if (p.get("programs") or []) else "error"
         out.append(
             {
@@ -1799,6 +2475,23 @@ def debug_last_results():
     return out
 
 
+@app.get("/debug/stores")
+def debug_stores():
+    """Sizes of the bounded in-memory stores, for spotting growth on long-running workers."""
+    stores = {
+        "jobs": _jobs,
+        "rebuilt_jobs": _REBUILT_JOBS,
+        "last_results": _LAST_RESULTS,
+        "inserted_ids": _INSERTED_IDS,
+        "inquiry_docs": _INQUIRY_DOCS,
+        "payload_rows": _PAYLOAD_ROWS,
+        "shares_fallback": _SHARES_FALLBACK,
+        "offers_read_cache": _offers_read_cache,
+        "extract_cache": _EXTRACT_CACHE,
+    }
+    return {name: {"size": len(d), "max": d.maxsize} for name, d in stores.items()}
+
+
 @app.get("/debug/doc/{doc_id}")
 def debug_doc(doc_id: str):
     p = _LAST_RESULTS.get(doc_id)
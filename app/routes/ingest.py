@@ -5,6 +5,7 @@ import os
 
 from app.gpt_extractor import extract_offer_from_pdf_bytes
 from app.services.persist_offers import persist_offers
+from app.services.offers_read_cache import invalidate as invalidate_offer_reads
 
 router = APIRouter(prefix="/ingest", tags=["ingest"])
 engine = create_engine(os.environ["DATABASE_URL"], future=True)
@@ -16,4 +17,5 @@ async def ingest_pdf(file: UploadFile = File(...)):
     count = len(normalized.get("programs") or [])
     print(f"[ingest] programs detected: {count} -> {[p.get('program_code') for p in normalized.get('programs',[])]}")
     ids = persist_offers(engine, file.filename, normalized)
+    invalidate_offer_reads()
     return {"inserted": len(ids), "ids": ids, "filename": file.filename}
@@ -1,11 +1,13 @@
 # app/routes/offers_by_documents.py
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 import os
 import json
 
 from fastapi import APIRouter, Body
 from sqlalchemy import create_engine, text
 
+from app.services.offers_read_cache import OFFERS_READ_CACHE_TTL_S, generation, read_cache
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL env var is required")
@@ -13,6 +15,10 @@ if not DATABASE_URL:
 engine = create_engine(DATABASE_URL, future=True)
 router = APIRouter(prefix="/offers", tags=["offers"])
 
+# The FE polls this with the same document ids while a job runs; answers are reused for
+# a few seconds and dropped whenever offers are written (see app.services.offers_read_cache).
+_cache: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = read_cache(512)
+
 
 def flatten_features(features_obj: Any) -> Dict[str, Any]:
     """
@@ -58,6 +64,13 @@ def offers_by_documents(payload: Dict[str, Any] = Body(...)) -> List[Dict[str, A
     if not document_ids:
         return []
 
+    # Generation seen before the read: an answer read across a write is never served
+    key = (tuple(str(d) for d in document_ids), generation())
+    if OFFERS_READ_CACHE_TTL_S > 0:
+        hit = _cache.get_fresh(key)
+        if hit is not None:
+            return hit
+
     sql = text("""
         SELECT
           id,
@@ -116,4 +129,7 @@ def offers_by_documents(payload: Dict[str, Any] = Body(...)) -> List[Dict[str, A
     for fname in document_ids:
         if fname not in seen:
             out.append({"source_file": fname, "programs": []})
+
+    if OFFERS_READ_CACHE_TTL_S > 0:
+        _cache[key] = out
     return out
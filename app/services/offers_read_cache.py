@@ -0,0 +1,98 @@
+# app/services/offers_read_cache.py
+"""
+Short-lived caches for the polled offers read endpoints (app.main and
+app/routes/offers_by_documents) and the write generation that invalidates them.
+"""
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class BoundedDict(OrderedDict):
+    """
+    Dict capped at `maxsize` entries; writes refresh a key and evict the oldest one.
+    With `ttl_s`, entries not written for that long are also dropped on the next write;
+    only get_fresh() treats them as missing before that ([] / get() still return them).
+    """
+
+    def __init__(self, maxsize: int, ttl_s: Optional[float] = None):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._written: Dict[Any, float] = {}
+        # Re-entrant: OrderedDict's pop()/popitem() call __delitem__ on subclasses
+        self._lock = threading.RLock()
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            now = time.monotonic()
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            self._written[key] = now
+            while self and (
+                len(self) > self.maxsize
+                or (self.ttl_s is not None and now - self._written[next(iter(self))] > self.ttl_s)
+            ):
+                self.popitem(last=False)
+
+    def __delitem__(self, key) -> None:
+        with self._lock:
+            super().__delitem__(key)
+            self._written.pop(key, None)
+
+    def pop(self, key, *default):
+        with self._lock:
+            self._written.pop(key, None)
+            return super().pop(key, *default)
+
+    def popitem(self, last: bool = True):
+        with self._lock:
+            key, value = super().popitem(last=last)
+            self._written.pop(key, None)
+            return key, value
+
+    def get_fresh(self, key, default=None):
+        """Like get(), but treats entries older than `ttl_s` as missing."""
+        with self._lock:
+            written = self._written.get(key)
+            if written is None or (self.ttl_s is not None and time.monotonic() - written > self.ttl_s):
+                return default
+            return super().get(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self._written.clear()
+
+
+# Share viewers and job pages poll the offers read endpoints; answers are reused for a
+# few seconds and dropped whenever this process writes offers (0 disables the caches).
+OFFERS_READ_CACHE_TTL_S = float(os.getenv("OFFERS_READ_CACHE_TTL_S", "5"))
+
+# Write generation of this process' offers; every value is unique. Cache keys include the
+# generation seen before the read, so an answer read across a write is never served.
+_GENERATIONS = itertools.count(1)
+_generation = 0
+_caches: List[BoundedDict] = []
+
+
+def read_cache(maxsize: int) -> BoundedDict:
+    """A BoundedDict with the read-cache TTL that invalidate() clears."""
+    cache = BoundedDict(maxsize, ttl_s=OFFERS_READ_CACHE_TTL_S)
+    _caches.append(cache)
+    return cache
+
+
+def generation() -> int:
+    return _generation
+
+
+def invalidate() -> None:
+    """Call after writing offers rows."""
+    global _generation
+    _generation = next(_GENERATIONS)
+    for cache in _caches:
+        cache.clear()
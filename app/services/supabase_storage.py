@@ -1,9 +1,17 @@
 from supabase import create_client, Client
 import os
+from functools import lru_cache
 from typing import Union
 from fastapi import UploadFile
 import tempfile
 
+
+@lru_cache(maxsize=1)
+def _storage_client() -> Client:
+    """Shared service-role client so storage calls reuse one HTTP connection pool."""
+    return create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+
+
 def put_pdf_and_get_path(upload_file: UploadFile) -> str:
     """
     Store a PDF in Supabase Storage and return its durable path.
@@ -15,7 +23,7 @@ def put_pdf_and_get_path(upload_file: UploadFile) -> str:
     Returns:
         str: Durable path like supabase://offers/batch_X/file.pdf
     """
-    sb: Client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+    sb: Client = _storage_client()
     bucket = "offers"
     
     # Use env BATCH_ID or "manual" if not set
@@ -53,7 +61,7 @@ def get_pdf_from_storage(durable_path: str) -> Union[str, None]:
             bucket, key = path.split("/", 1)
             
             # Get signed URL first (required for download)
-            sb = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+            sb = _storage_client()
             resp = sb.storage.from_(bucket).create_signed_url(key, 60)  # 60s is enough to fetch
             signed_url = resp.get("signed_url") or resp.get("signedURL") or resp["signedURL"]
             
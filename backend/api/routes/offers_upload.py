@@ -5,7 +5,7 @@ import os, uuid, traceback
 from datetime import datetime, timedelta, timezone
 from psycopg2.extras import RealDictCursor
 from psycopg2 import Error as PGError
-from backend.api.routes.util import get_db_connection, safe_filename
+from backend.api.routes.util import get_db_connection, safe_filename, is_pdf_filename
 
 try:
     from backend.api.routes.qa import _reembed_file
@@ -75,7 +75,7 @@ async def upload_and_chunk(
     org_id_f: Optional[int] = Form(None),
     batch_token_f: Optional[str] = Form(None),
 ) -> Dict[str, Any]:
-    if not (pdf.filename or "").lower().endswith(".pdf"):
+    if not is_pdf_filename(pdf.filename):
         raise HTTPException(status_code=415, detail="PDF required")
 
     # Resolve params: query has priority, then form, fallback to env for org_id
@@ -1,20 +1,28 @@
 """Utility functions for API routes"""
 import os
+import re
 from typing import Any, Dict
 from pathlib import Path
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+# Anything that is not alphanumeric or one of ".-_" (\w == isalnum() plus "_")
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^\w.\-]")
+
 def safe_filename(filename: str) -> str:
     """Sanitize filename for safe storage"""
     # Remove path components and dangerous characters
     safe = os.path.basename(filename)
     # Replace unsafe characters with underscores
-    safe = "".join(c if c.isalnum() or c in ".-_" else "_" for c in safe)
+    safe = _UNSAFE_FILENAME_CHARS.sub("_", safe)
     # Limit length
-    safe = safe[:100] if len(safe) > 100 else safe
+    safe = safe[:100]
     return safe or "uploaded_file"
 
+def is_pdf_filename(filename: str | None) -> bool:
+    """Case-insensitive ".pdf" suffix check without lower-casing the whole name"""
+    return bool(filename) and filename[-4:].lower() == ".pdf"
+
 def get_db_connection():
     """
     Prefer DATABASE_URL (single var, matches the rest of the app).
@@ -41,7 +49,7 @@ def validate_mime(mime_type: str, filename: str) -> None:
     """Validate that the file is a PDF based on mime type and extension"""
     if not mime_type or not mime_type.lower() == 'application/pdf':
         raise ValueError(f"Invalid mime type: {mime_type}")
-    if not filename or not filename.lower().endswith('.pdf'):
+    if not is_pdf_filename(filename):
         raise ValueError(f"Invalid filename extension: {filename}")
 
 def ensure_offer_vs(conn: Any, org_id: int, batch_token: str | None = None) -> str:
@@ -0,0 +1,13 @@
+-- Migration: Prefix index for job lookups on public.offers.filename
+-- GET /jobs/{job_id} and /offers/by-job/{job_id} rebuild a job the process no longer
+-- holds from its offers rows with filename LIKE '<job_id>::%'. Under a non-C collation
+-- the (filename, id) btree cannot serve LIKE; a text_pattern_ops index can.
+--
+-- Usage:
+--   psql $DATABASE_URL -f backend/scripts/add_offers_filename_pattern_index.sql
+--   Or run in your database admin tool (Supabase SQL editor, etc.)
+
+CREATE INDEX IF NOT EXISTS idx_offers_filename_pattern ON public.offers(filename text_pattern_ops);
+
+-- Verify (optional - uncomment to run)
+-- EXPLAIN SELECT filename FROM public.offers WHERE filename LIKE '00000000-0000-0000-0000-000000000000::%';
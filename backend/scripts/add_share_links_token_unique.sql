@@ -0,0 +1,30 @@
+-- Migration: Enforce unique share tokens on public.share_links
+-- POST /shares draws a random token and relies on a unique constraint to detect the
+-- (very unlikely) reuse of an existing one; on a 23505 conflict it retries with a new token.
+-- Most schemas already have one (DATABASE_CHANGES.md references share_links(token) from
+-- a foreign key, which requires it), so this only adds it where it is missing and leaves
+-- the plain idx_share_links_token from add_share_links_stats_columns.sql in place.
+--
+-- Usage:
+--   psql $DATABASE_URL -f backend/scripts/add_share_links_token_unique.sql
+--   Or run in your database admin tool (Supabase SQL editor, etc.)
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = 'public.share_links'::regclass
+          AND i.indisunique
+          AND i.indnatts = 1
+          AND a.attname = 'token'
+    ) THEN
+        -- Fails if duplicate tokens already exist; find them first with the check below
+        CREATE UNIQUE INDEX uq_share_links_token ON public.share_links(token);
+    END IF;
+END
+$$;
+
+-- Verify (optional - uncomment to run)
+-- SELECT token, count(*) FROM public.share_links GROUP BY token HAVING count(*) > 1;
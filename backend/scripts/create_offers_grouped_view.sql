@@ -0,0 +1,76 @@
+-- Migration: Per-document grouped view over public.offers
+-- Lets GET /offers/by-job/{job_id}, share links and /shares meta derivation fetch
+-- one pre-aggregated row per document instead of every offers row (incl. raw_json).
+-- Mirrors app.main._aggregate_offers_rows:
+--   * group meta comes from the first row (lowest id) of the document
+--   * programs = non-error rows, ordered by id
+--   * an 'error' first row is upgraded to 'parsed' when any parsed row exists
+--   * a group without programs or error becomes status 'error' / 'no programs'
+--
+-- Usage:
+--   psql $DATABASE_URL -f backend/scripts/create_offers_grouped_view.sql
+--   Or run in your database admin tool (Supabase SQL editor, etc.)
+
+-- Filename lookups use this index
+CREATE INDEX IF NOT EXISTS idx_offers_filename_id ON public.offers(filename, id);
+
+-- A single GROUP BY filename (first-row meta picked with array_agg(... ORDER BY id)[1])
+-- so a source_file filter on the view is pushed down to the offers scan and only the
+-- requested documents are aggregated.
+CREATE OR REPLACE VIEW public.offers_grouped AS
+SELECT
+    g.source_file,
+    g.first_row_id,
+    g.programs,
+    g.inquiry_id,
+    CASE
+        WHEN g.first_status = 'error' AND g.any_parsed THEN 'parsed'
+        WHEN jsonb_array_length(g.programs) = 0 AND g.first_error IS NULL THEN 'error'
+        ELSE g.first_status
+    END AS status,
+    CASE
+        WHEN g.first_status = 'error' AND g.any_parsed THEN NULL
+        WHEN jsonb_array_length(g.programs) = 0 AND g.first_error IS NULL THEN 'no programs'
+        ELSE g.first_error
+    END AS error,
+    g.company_hint,
+    g.insurer_hint,
+    g.company_name,
+    g.employee_count
+FROM (
+    SELECT
+        filename AS source_file,
+        min(id) AS first_row_id,
+        (array_agg(inquiry_id ORDER BY id))[1] AS inquiry_id,
+        (array_agg(COALESCE(NULLIF(status, ''), 'parsed') ORDER BY id))[1] AS first_status,
+        (array_agg(NULLIF(error, '') ORDER BY id))[1] AS first_error,
+        (array_agg(company_hint ORDER BY id))[1] AS company_hint,
+        (array_agg(COALESCE(NULLIF(insurer, ''), NULLIF(company_hint, '')) ORDER BY id))[1] AS insurer_hint,
+        (array_agg(company_name ORDER BY id))[1] AS company_name,
+        (array_agg(employee_count ORDER BY id))[1] AS employee_count,
+        COALESCE(
+            jsonb_agg(
+                jsonb_build_object(
+                    'row_id', id,
+                    'insurer', insurer,
+                    'program_code', program_code,
+                    'base_sum_eur', base_sum_eur,
+                    'premium_eur', premium_eur,
+                    'payment_method', payment_method,
+                    'features', COALESCE(features, '{}'::jsonb)
+                )
+                ORDER BY id
+            ) FILTER (WHERE COALESCE(NULLIF(status, ''), 'parsed') <> 'error'),
+            '[]'::jsonb
+        ) AS programs,
+        bool_or(COALESCE(NULLIF(status, ''), 'parsed') = 'parsed') AS any_parsed
+    FROM public.offers
+    GROUP BY filename
+) g;
+
+COMMENT ON VIEW public.offers_grouped IS 'One row per offers.filename with programs aggregated as JSON (see app.main._offers_by_document_ids)';
+
+-- Verify (optional - uncomment to run)
+-- SELECT source_file, status, jsonb_array_length(programs) FROM public.offers_grouped LIMIT 10;
+-- The filter must show up as an Index Cond on offers, below the GroupAggregate:
+-- EXPLAIN SELECT * FROM public.offers_grouped WHERE source_file = ANY(ARRAY['a.pdf']);
@@ -0,0 +1,152 @@
+"""
+Tests for the in-memory offer helpers in app.main.
+
+Run with:
+    python -m pytest backend/tests/test_main_offers.py -v
+"""
+
+from app.main import _aggregate_offers_rows, _BoundedDict
+
+
+class TestAggregateOffersRows:
+    """Test grouping of offers rows into per-document results"""
+
+    def test_groups_programs_by_filename_in_order(self):
+        """Rows are grouped per filename, preserving first-seen order"""
+        rows = [
+            {"id": 1, "filename": "a", "insurer": "BTA", "program_code": "P1", "status": "parsed"},
+            {"id": 2, "filename": "b", "insurer": "ERGO", "program_code": "P2", "status": "parsed"},
+            {"id": 3, "filename": "a", "insurer": "BTA", "program_code": "P3", "status": "parsed"},
+        ]
+        out = _aggregate_offers_rows(rows)
+        assert [g["source_file"] for g in out] == ["a", "b"]
+        assert [p["row_id"] for p in out[0]["programs"]] == [1, 3]
+        assert out[0]["insurer_hint"] == "BTA"
+        assert out[0]["status"] == "parsed"
+
+    def test_error_row_is_cleared_by_parsed_row(self):
+        """A parsed row for the same file overrides an earlier error status"""
+        rows = [
+            {"filename": "a", "status": "error", "error": "no programs"},
+            {"id": 5, "filename": "a", "status": "parsed", "program_code": "P"},
+        ]
+        out = _aggregate_offers_rows(rows)
+        assert out[0]["status"] == "parsed"
+        assert out[0]["error"] is None
+        assert len(out[0]["programs"]) == 1
+
+    def test_empty_group_marked_as_error(self):
+        """A group with no programs and no error gets 'no programs'"""
+        out = _aggregate_offers_rows([{"filename": "a", "status": "error"}])
+        assert out[0]["status"] == "error"
+        assert out[0]["error"] == "no programs"
+        assert out[0]["programs"] == []
+
+
+class TestBoundedDict:
+    """Test the bounded in-memory store"""
+
+    def test_evicts_oldest_write(self):
+        """Past maxsize the least recently written key is dropped"""
+        d = _BoundedDict(2)
+        d["a"] = 1
+        d["b"] = 2
+        d["a"] = 3
+        d["c"] = 4
+        assert list(d.items()) == [("a", 3), ("c", 4)]
+
+    def test_ttl_expires_on_write(self, monkeypatch):
+        """Entries older than ttl_s are dropped on the next write"""
+        import app.main as main
+
+        now = [100.0]
+        monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+        d = _BoundedDict(10, ttl_s=5)
+        d["a"] = 1
+        now[0] = 110.0
+        d["b"] = 2
+        assert list(d) == ["b"]
+
+    def test_get_fresh_ignores_expired(self, monkeypatch):
+        """get_fresh misses once an entry is older than ttl_s"""
+        import app.main as main
+
+        now = [100.0]
+        monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+        d = _BoundedDict(10, ttl_s=5)
+        d["a"] = 1
+        assert d.get_fresh("a") == 1
+        now[0] = 106.0
+        assert d.get_fresh("a") is None
+
+    def test_removal_drops_write_time(self):
+        """pop, del and popitem forget the key's write timestamp"""
+        d = _BoundedDict(10, ttl_s=5)
+        for k in "abc":
+            d[k] = k
+        d.pop("a")
+        del d["b"]
+        d.popitem()
+        assert not d and d._written == {}
+
+
+class TestExtractCache:
+    """Test the content-hash extraction cache"""
+
+    def test_identical_bytes_extract_once(self, monkeypatch):
+        """A repeated PDF is served from the cache under its new document id"""
+        import app.main as main
+
+        calls = []
+
+        def fake_extract(data, document_id):
+            calls.append(document_id)
+            return {"document_id": document_id, "programs": [{"program_code": "A"}]}
+
+        monkeypatch.setattr(main, "extract_offer_from_pdf_bytes", fake_extract)
+        monkeypatch.setattr(main, "_EXTRACT_CACHE", _BoundedDict(4))
+
+        first = main._extract_cached(b"%PDF-same", "doc-1")
+        first["company_name"] = "mutated by caller"
+        second = main._extract_cached(b"%PDF-same", "doc-2")
+
+        assert calls == ["doc-1"]
+        assert second == {"document_id": "doc-2", "programs": [{"program_code": "A"}]}
+
+
+class TestInquiryIndex:
+    """Test the inquiry -> in-memory payload index"""
+
+    def test_payload_indexed_once_stored(self, monkeypatch):
+        """A poll before the payload is stored does not drop it from the index"""
+        import app.main as main
+
+        monkeypatch.setattr(main, "_LAST_RESULTS", _BoundedDict(8))
+        monkeypatch.setattr(main, "_INQUIRY_DOCS", _BoundedDict(8))
+        payload = {"document_id": "doc-1", "programs": []}
+        main._inject_meta(payload, insurer="BTA", company="ACME", insured_count=3, inquiry_id="77")
+
+        assert main._last_results_for_inquiry(77) == []
+        main._store_result("doc-1", payload)
+        assert main._last_results_for_inquiry(77) == [payload]
+
+
+class TestOffersReadCache:
+    """Test the short-lived offers read cache"""
+
+    def test_read_racing_a_write_is_not_served(self, monkeypatch):
+        """An answer read across an invalidation is not reused afterwards"""
+        import app.main as main
+
+        answers = [[], [{"source_file": "doc-1"}]]
+
+        def fake_read(doc_ids):
+            main._invalidate_offer_reads()  # an insert lands while this read runs
+            return answers.pop(0)
+
+        monkeypatch.setattr(main, "OFFERS_READ_CACHE_TTL_S", 5.0)
+        monkeypatch.setattr(main, "_offers_read_cache", _BoundedDict(8, ttl_s=5.0))
+        monkeypatch.setattr(main, "_offers_by_document_ids", fake_read)
+
+        assert main._cached_offers_by_document_ids(["doc-1"]) == []
+        assert main._cached_offers_by_document_ids(["doc-1"]) == [{"source_file": "doc-1"}]
@@ -0,0 +1,49 @@
+"""
+Tests for shared route utilities.
+
+Run with:
+    python -m pytest backend/tests/test_util.py -v
+"""
+
+from backend.api.routes.util import is_pdf_filename, safe_filename
+
+
+class TestSafeFilename:
+    """Test filename sanitization"""
+
+    def test_keeps_safe_characters(self):
+        """Alphanumerics and . - _ are preserved"""
+        assert safe_filename("Offer_2024-v1.pdf") == "Offer_2024-v1.pdf"
+
+    def test_replaces_each_unsafe_character(self):
+        """Every unsafe character becomes its own underscore (no collapsing)"""
+        assert safe_filename("a  b(1).pdf") == "a__b_1_.pdf"
+
+    def test_keeps_unicode_letters(self):
+        """Non-ASCII letters count as alphanumeric"""
+        assert safe_filename("Piedāvājums BTA.pdf") == "Piedāvājums_BTA.pdf"
+
+    def test_strips_path_and_limits_length(self):
+        """Directory components are dropped and the result is capped at 100 chars"""
+        assert safe_filename("/tmp/dir/x.pdf") == "x.pdf"
+        assert len(safe_filename("a" * 150 + ".pdf")) == 100
+
+    def test_empty_falls_back(self):
+        """Empty names get a placeholder"""
+        assert safe_filename("") == "uploaded_file"
+
+
+class TestIsPdfFilename:
+    """Test the .pdf suffix check"""
+
+    def test_suffix_case_insensitive(self):
+        """Any casing of .pdf is accepted"""
+        assert is_pdf_filename("offer.PDF")
+        assert is_pdf_filename("a.Pdf")
+
+    def test_rejects_other_names(self):
+        """Empty names and other extensions are rejected"""
+        assert not is_pdf_filename(None)
+        assert not is_pdf_filename("")
+        assert not is_pdf_filename("pdf")
+        assert not is_pdf_filename("offer.pdf.txt")